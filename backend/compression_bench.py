@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Compression benchmark for the API list endpoints
+Measures bytes on the wire and CPU time per response for a worst-case
+GET /api/contact payload (1000 messages of 2000 characters) at several
+gzip levels and Brotli qualities
+"""
+
+import json
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from http_cache import BROTLI, GZIP, CompressionPolicy
+
+WORDS = (
+    "integración odoo api erp facturación electrónica pagos kushki payphone "
+    "necesito cotización empresa sistema legacy conectar inventario ventas "
+    "automatizar n8n reportes contabilidad soporte migración datos clientes"
+).split()
+
+
+def build_payload(count: int = 1000, length: int = 2000) -> bytes:
+    rng = random.Random(42)
+    messages = []
+    for i in range(count):
+        text = ""
+        while len(text) < length:
+            text += rng.choice(WORDS) + " "
+        messages.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": f"Cliente {i}",
+            "email": f"cliente{i}@empresa{i % 37}.com",
+            "company": f"Empresa {i % 37}" if i % 3 else None,
+            "message": text[:length],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "read": bool(i % 2),
+            "replied": bool(i % 5 == 0),
+        })
+    # Serialized the way Starlette's JSONResponse does
+    return json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def measure(payload: bytes, encoding: str, policy: CompressionPolicy, rounds: int) -> tuple:
+    size = 0
+    started = time.process_time()
+    for _ in range(rounds):
+        compressor = policy.compressor(encoding)
+        size = len(compressor.compress(payload) + compressor.flush())
+    return size, (time.process_time() - started) / rounds * 1000
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    payload = build_payload()
+    print(f"Uncompressed: {len(payload):,} bytes")
+    print(f"{'encoding':<10}{'level':>6}{'bytes':>12}{'ratio':>8}{'cpu ms':>10}")
+    for level in (1, 4, 5, 6, 9):
+        size, cpu = measure(payload, GZIP, CompressionPolicy(gzip_level=level), rounds)
+        print(f"{GZIP:<10}{level:>6}{size:>12,}{len(payload) / size:>8.1f}{cpu:>10.1f}")
+    for quality in (1, 4, 5, 6, 11):
+        size, cpu = measure(payload, BROTLI, CompressionPolicy(brotli_quality=quality), rounds)
+        print(f"{BROTLI:<10}{quality:>6}{size:>12,}{len(payload) / size:>8.1f}{cpu:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,17 @@ from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from resilience import CircuitBreaker
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Upper bound for a single SMTP send. Keep it well below the request budget
+# (REQUEST_TIMEOUT_SECONDS): the send runs after the Mongo writes, and a
+# timeout only trips the breaker when it hits this cap, not the budget.
+SMTP_TIMEOUT_SECONDS = float(os.environ.get('SMTP_TIMEOUT_SECONDS', '4'))
+
 # Email configuration
 conf = ConnectionConfig(
     MAIL_USERNAME=os.environ.get('GMAIL_USER', ''),
@@ -17,14 +23,28 @@ conf = ConnectionConfig(
     MAIL_STARTTLS=True,
     MAIL_SSL_TLS=False,
     USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
+    VALIDATE_CERTS=True,
+    TIMEOUT=int(SMTP_TIMEOUT_SECONDS)
 )
 
 fast_mail = FastMail(conf)
 
+# Once SMTP keeps failing, skip notifications instead of waiting on it
+email_breaker = CircuitBreaker(
+    "smtp",
+    failure_threshold=0.5,
+    window=10,
+    min_calls=3,
+    reset_timeout=60.0,
+    timeout=SMTP_TIMEOUT_SECONDS,
+)
+
 async def send_contact_notification(contact_data: dict):
     """
     Send email notification when a new contact form is submitted
+
+    Raises CircuitOpenError without contacting SMTP while the breaker is open,
+    and DeadlineExceeded if the send outlives the request's budget.
     """
     
     # Email HTML template with inline logo
@@ -83,7 +103,7 @@ async def send_contact_notification(contact_data: dict):
         subtype="html"
     )
     
-    await fast_mail.send_message(message)
+    await email_breaker.call(fast_mail.send_message, message)
 
 
 def create_google_calendar_link(title: str, description: str, duration: int = 60):
@@ -0,0 +1,189 @@
+import zlib
+from typing import Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+GZIP = "gzip"
+BROTLI = "br"
+
+
+# Collection version counters (bumped on every write, used for list ETags)
+async def collection_version(db, name: str) -> int:
+    """
+    Current version of a collection; 0 if it was never bumped
+    """
+    doc = await db.collection_versions.find_one({"_id": name})
+    return doc["version"] if doc else 0
+
+
+async def bump_version(db, *names: str):
+    """
+    Invalidate cached lists of the given collections
+    """
+    for name in names:
+        await db.collection_versions.update_one({"_id": name}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def list_etag(name: str, version: int) -> str:
+    return f'"{name}-v{version}"'
+
+
+def matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    Return the tag from If-None-Match that matches etag, if any
+
+    Tags rewritten by CompressionMiddleware ("...-gzip"/"...-br") match the
+    uncompressed etag, so clients get a 304 whichever encoding they cached.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    base = etag[:-1]
+    for tag in (t.strip() for t in if_none_match.split(",")):
+        if tag == etag or tag in (f'{base}-{GZIP}"', f'{base}-{BROTLI}"'):
+            return tag
+    return None
+
+
+class CompressionPolicy:
+    """
+    Per-route compression settings
+
+    Args:
+        minimum_size: Responses smaller than this (in bytes) are sent as is
+        gzip_level: zlib level 1-9
+        brotli_quality: Brotli quality 0-11
+    """
+
+    def __init__(self, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compressor(self, encoding: str):
+        """
+        Streaming compressor exposing compress(data) and flush()
+        """
+        if encoding == BROTLI:
+            return _BrotliCompressor(self.brotli_quality)
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick br or gzip from an Accept-Encoding header, honouring q-values
+    and preferring br on ties
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    best = None
+    for coding in (BROTLI, GZIP):
+        q = weights.get(coding, wildcard)
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing successful responses on configured routes
+
+    Bodies are compressed chunk by chunk as they are sent, so streaming
+    responses stay streamed. Leading chunks are held back only until the
+    route's minimum_size is reached; smaller bodies are left alone.
+    """
+
+    def __init__(self, app, routes: dict):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        policy = self.routes.get(scope["path"]) if scope["type"] == "http" else None
+        if policy is None:
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        await self.app(scope, receive, _CompressingSend(send, policy, encoding))
+
+
+class _CompressingSend:
+    def __init__(self, send, policy: CompressionPolicy, encoding: Optional[str]):
+        self.send = send
+        self.policy = policy
+        self.encoding = encoding
+        self.start = None
+        self.buffer = b""
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = MutableHeaders(scope=message)
+            headers.add_vary_header("Accept-Encoding")
+            if self.encoding is None or message["status"] != 200 or "content-encoding" in headers:
+                self.passthrough = True
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            # Hold back small leading chunks until we know the body is worth compressing
+            self.buffer += body
+            if more_body and len(self.buffer) < self.policy.minimum_size:
+                return
+            return await self._begin(more_body)
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.flush()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _begin(self, more_body: bool):
+        body, self.buffer = self.buffer, b""
+        if not more_body and len(body) < self.policy.minimum_size:
+            self.passthrough = True
+            await self.send(self.start)
+            return await self.send({"type": "http.response.body", "body": body, "more_body": False})
+
+        headers = MutableHeaders(scope=self.start)
+        self.compressor = self.policy.compressor(self.encoding)
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.flush()
+            headers["Content-Length"] = str(len(data))
+        elif "content-length" in headers:
+            del headers["Content-Length"]
+        headers["Content-Encoding"] = self.encoding
+        etag = headers.get("etag")
+        if etag and etag.endswith('"') and not etag.startswith("W/"):
+            # A strong ETag must differ between content codings
+            headers["ETag"] = f'{etag[:-1]}-{self.encoding}"'
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
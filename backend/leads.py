@@ -0,0 +1,163 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# How many message ids each lead keeps, newest first
+RECENT_MESSAGES = 10
+
+# Time limit for an offline or startup rebuild (request-path rebuilds use the request budget)
+REBUILD_MAX_TIME_MS = int(os.environ.get('LEADS_REBUILD_MAX_TIME_MS', str(10 * 60 * 1000)))
+
+
+def normalize_email(email: str) -> str:
+    """
+    Key used for the leads collection: trimmed, lower-cased email
+    """
+    return email.strip().lower()
+
+
+async def ensure_indexes(db):
+    """
+    Create the indexes lead upserts and listings rely on
+    """
+    await db.leads.create_index([("email", ASCENDING)], unique=True)
+    await db.leads.create_index([("last_seen", DESCENDING)])
+    await db.contact_messages.create_index([("id", ASCENDING)])
+
+
+async def record_message(db, doc: dict):
+    """
+    Upsert the lead for a newly stored contact message
+    Args:
+        db: Motor database
+        doc: Contact message document as inserted into contact_messages
+    """
+    update = {
+        "$setOnInsert": {"email": normalize_email(doc["email"])},
+        "$min": {"first_seen": doc["created_at"]},
+        "$max": {"last_seen": doc["created_at"]},
+        "$set": {"name": doc["name"]},
+        "$inc": {"message_count": 1, "unread_count": 0 if doc.get("read") else 1},
+        "$push": {
+            "recent_message_ids": {"$each": [doc["id"]], "$position": 0, "$slice": RECENT_MESSAGES}
+        },
+    }
+    if doc.get("company"):
+        update["$set"]["company"] = doc["company"]
+    await db.leads.update_one({"email": normalize_email(doc["email"])}, update, upsert=True)
+
+
+async def record_update(db, before: dict, after: dict):
+    """
+    Adjust the lead's unread count after a message's read flag changed
+    Args:
+        db: Motor database
+        before: Message document prior to the update
+        after: Message document after the update
+    """
+    was_unread = not before.get("read", False)
+    is_unread = not after.get("read", False)
+    if was_unread == is_unread:
+        return
+    await db.leads.update_one(
+        {"email": normalize_email(after["email"])},
+        {"$inc": {"unread_count": 1 if is_unread else -1}}
+    )
+
+
+def rebuild_pipeline() -> list:
+    """
+    Aggregation pipeline that recomputes every lead from contact_messages
+    and replaces the leads collection with the result
+
+    Group state stays bounded per lead: message ids are capped with $firstN
+    (MongoDB 5.2+) and the latest company is a single $max over
+    {created_at, company} pairs, which ranks any pair above null.
+    """
+    return [
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": {"$toLower": {"$trim": {"input": "$email"}}},
+            "name": {"$first": "$name"},
+            "latest_company": {"$max": {"$cond": [
+                {"$eq": [{"$ifNull": ["$company", ""]}, ""]},
+                None,
+                {"at": "$created_at", "company": "$company"},
+            ]}},
+            "message_count": {"$sum": 1},
+            "unread_count": {"$sum": {"$cond": [{"$eq": ["$read", True]}, 0, 1]}},
+            "first_seen": {"$min": "$created_at"},
+            "last_seen": {"$max": "$created_at"},
+            "recent_message_ids": {"$firstN": {"input": "$id", "n": RECENT_MESSAGES}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "email": "$_id",
+            "name": 1,
+            "company": "$latest_company.company",
+            "message_count": 1,
+            "unread_count": 1,
+            "first_seen": 1,
+            "last_seen": 1,
+            "recent_message_ids": 1,
+        }},
+        {"$out": "leads"},
+    ]
+
+
+async def rebuild_leads(db, max_time_ms: Optional[int] = REBUILD_MAX_TIME_MS) -> int:
+    """
+    Rebuild the leads collection from scratch
+
+    $out swaps the new collection in only when the aggregation finishes, so
+    lead upserts made while it runs are lost. Run it while contact writes
+    are paused (e.g. `python leads.py` during a deploy), or run it again
+    afterwards.
+    Args:
+        db: Motor database
+        max_time_ms: Server-side time limit for the aggregation
+    Returns:
+        Number of leads after the rebuild
+    """
+    options = {"allowDiskUse": True}
+    if max_time_ms:
+        options["maxTimeMS"] = max_time_ms
+    await db.contact_messages.aggregate(rebuild_pipeline(), **options).to_list(None)
+    await ensure_indexes(db)
+    return await db.leads.count_documents({})
+
+
+async def backfill_if_empty(db) -> Optional[int]:
+    """
+    Build the leads collection once for deployments that predate it
+    Returns:
+        Number of leads built, or None if no backfill was needed
+    """
+    if await db.leads.estimated_document_count() > 0:
+        return None
+    if await db.contact_messages.estimated_document_count() == 0:
+        return None
+    return await rebuild_leads(db)
+
+
+async def _main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        count = await rebuild_leads(client[os.environ['DB_NAME']])
+        print(f"Rebuilt leads collection: {count} leads")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    # Offline rebuild; run while contact writes are paused
+    asyncio.run(_main())
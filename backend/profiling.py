@@ -0,0 +1,219 @@
+import cProfile
+import hmac
+import logging
+import marshal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = "cprofile"
+SAMPLE = "sample"
+MODES = (CPROFILE, SAMPLE)
+
+
+class _Sampler:
+    """
+    Statistical sampler: records the event loop thread's stack at a fixed
+    interval from a background thread and keeps collapsed-stack counts
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{Path(code.co_filename).stem}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Profiler:
+    """
+    On-demand request profiler
+
+    Requests are profiled either when they send an X-Profile header
+    ("cprofile" or "sample") along with the X-Profile-Token, or when a
+    route has been armed for its next N requests. Only one capture runs at
+    a time; cProfile sees everything on the event loop thread while
+    enabled, so concurrent requests show up in its output too.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        token: str = "",
+        max_captures: int = 20,
+        max_bytes: int = 5 * 1024 * 1024,
+        max_requests: int = 20,
+        sample_interval: float = 0.005,
+    ):
+        self.output_dir = Path(output_dir)
+        self.token = token
+        self.max_captures = max_captures
+        self.max_bytes = max_bytes
+        self.max_requests = max_requests
+        self.sample_interval = sample_interval
+        self._armed = {}
+        self._busy = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """
+        Constant-time token check; header values arrive latin-1 decoded, so
+        compare raw bytes (compare_digest rejects non-ASCII str)
+        """
+        if not self.enabled or token is None:
+            return False
+        try:
+            supplied = token.encode("latin-1")
+        except UnicodeEncodeError:
+            return False
+        return hmac.compare_digest(supplied, self.token.encode())
+
+    def arm(self, route: str, count: int, mode: str = CPROFILE) -> dict:
+        """
+        Profile the next `count` requests to `route` (capped at max_requests)
+        """
+        self._armed[route] = {"remaining": min(count, self.max_requests), "mode": mode}
+        return self._armed[route]
+
+    def disarm(self, route: Optional[str] = None):
+        if route is None:
+            self._armed.clear()
+        else:
+            self._armed.pop(route, None)
+
+    def status(self) -> dict:
+        return {
+            "armed": dict(self._armed),
+            "busy": self._busy,
+            "captures": len(self._captures()),
+            "max_captures": self.max_captures,
+            "output_dir": str(self.output_dir),
+        }
+
+    def claim(self, scope) -> Optional[str]:
+        """
+        Decide whether this request should be profiled and with which mode
+        """
+        if self._busy:
+            return None
+        armed = self._armed.get(scope["path"])
+        if armed is not None:
+            armed["remaining"] -= 1
+            if armed["remaining"] <= 0:
+                del self._armed[scope["path"]]
+            return armed["mode"]
+        token = mode = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                token = value.decode("latin-1")
+            elif name == b"x-profile":
+                mode = value.decode("latin-1")
+        if mode in MODES and self.authorized(token):
+            return mode
+        return None
+
+    async def capture(self, mode: str, label: str, awaitable):
+        """
+        Await the request while profiling it and write the result to disk
+        """
+        self._busy = True
+        started = time.perf_counter()
+        try:
+            if mode == SAMPLE:
+                sampler = _Sampler(threading.get_ident(), self.sample_interval)
+                sampler.start()
+                try:
+                    return await awaitable
+                finally:
+                    sampler.stop()
+                    self._write(label, "folded", self._collapsed(sampler.stacks))
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return await awaitable
+            finally:
+                profile.disable()
+                profile.create_stats()
+                self._write(label, "prof", marshal.dumps(profile.stats))
+        finally:
+            self._busy = False
+            logger.info(f"Profiled {label} ({mode}) in {time.perf_counter() - started:.3f}s")
+
+    def _collapsed(self, stacks: Counter) -> bytes:
+        """
+        Render stacks in the collapsed format used by flamegraph tools,
+        truncated at a line boundary to max_bytes
+        """
+        out = bytearray()
+        for stack, count in stacks.most_common():
+            line = f"{stack} {count}\n".encode()
+            if len(out) + len(line) > self.max_bytes:
+                break
+            out += line
+        return bytes(out)
+
+    def _captures(self):
+        if not self.output_dir.is_dir():
+            return []
+        return [p for p in self.output_dir.iterdir() if p.suffix in (".prof", ".folded")]
+
+    def _write(self, label: str, suffix: str, data: bytes):
+        if len(self._captures()) >= self.max_captures:
+            logger.warning(f"Profile capture limit ({self.max_captures}) reached, discarding {label}")
+            return
+        if len(data) > self.max_bytes:
+            logger.warning(f"Profile for {label} is {len(data)} bytes, over the {self.max_bytes} byte limit")
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        slug = label.strip("/").replace("/", "_") or "root"
+        path = self.output_dir / f"{stamp}-{slug}.{suffix}"
+        path.write_bytes(data)
+        logger.info(f"Wrote profile {path}")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that hands selected requests to the Profiler; when
+    profiling is disabled it is a single attribute check per request
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        mode = self.profiler.claim(scope)
+        if mode is None:
+            return await self.app(scope, receive, send)
+        await self.profiler.capture(mode, scope["path"], self.app(scope, receive, send))
+
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Absolute deadline (time.monotonic()) for the request being served
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an operation runs past the request's deadline budget"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit breaker is open"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit '{name}' is open")
+        self.name = name
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """
+    Set the deadline budget for the current request
+    """
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(default: Optional[float] = None, cap: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left in the current request's budget
+
+    Args:
+        default: Value returned when no deadline is set
+        cap: Upper bound applied to the result (e.g. a per-dependency timeout)
+    Returns:
+        Remaining seconds (never negative), or default when no deadline is set
+    """
+    deadline = _deadline.get()
+    left = default if deadline is None else max(deadline - time.monotonic(), 0.0)
+    if cap is not None:
+        left = cap if left is None else min(left, cap)
+    return left
+
+
+def remaining_ms(default: Optional[float] = None, cap: Optional[float] = None) -> Optional[int]:
+    """
+    Remaining budget in whole milliseconds, suitable for MongoDB's maxTimeMS
+    """
+    left = remaining(default, cap)
+    return None if left is None else max(int(left * 1000), 1)
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker
+
+    Opens once the failure ratio over the last `window` calls reaches
+    `failure_threshold` (after at least `min_calls` calls), rejects calls
+    while open, and lets a single trial call through after `reset_timeout`
+    seconds (half-open) to decide whether to close again. Results of calls
+    that were already running when the breaker opened are ignored.
+
+    Timeouts only count as failures when they hit the breaker's own
+    `timeout` cap. When the caller's request budget was the tighter limit,
+    the timeout (and any of `deadline_errors`, e.g. a server-side maxTimeMS
+    expiry) says nothing about the dependency's health and is not recorded,
+    so clients sending tiny budgets cannot trip the breaker for everyone.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        reset_timeout: float = 30.0,
+        timeout: Optional[float] = None,
+        deadline_errors: tuple = (),
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.timeout = timeout
+        self.deadline_errors = deadline_errors
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go through right now
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            return True
+        return False
+
+    def _transition(self, state: str):
+        if state != self._state:
+            logger.warning(f"Circuit '{self.name}' {self._state} -> {state}")
+        self._state = state
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        if state != self.OPEN:
+            self._trial_in_flight = False
+
+    def record_success(self, trial: bool = False):
+        """
+        Record a successful call; only the half-open trial may close the breaker
+        """
+        if trial:
+            self._outcomes.clear()
+            self._transition(self.CLOSED)
+        elif self._state == self.OPEN:
+            # Late result from a call started before the breaker opened
+            return
+        self._outcomes.append(True)
+
+    def record_failure(self, trial: bool = False):
+        """
+        Record a failed call; only the half-open trial may reopen the breaker
+        """
+        if trial:
+            self._transition(self.OPEN)
+            self._trial_in_flight = False
+            return
+        if self._state == self.OPEN:
+            # Late failure from a call started before the breaker opened;
+            # re-opening would push back the half-open trial
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if (
+            len(self._outcomes) >= self.min_calls
+            and failures / len(self._outcomes) >= self.failure_threshold
+        ):
+            self._transition(self.OPEN)
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Await func(*args, **kwargs) under the breaker and the request deadline
+
+        Raises:
+            CircuitOpenError: The breaker is open and the call was not attempted
+            DeadlineExceeded: The call did not finish within the remaining budget
+        """
+        if not self.allow():
+            self._rejected += 1
+            raise CircuitOpenError(self.name)
+
+        budget = remaining()
+        timeout = remaining(cap=self.timeout)
+        budget_bound = budget is not None and (self.timeout is None or budget < self.timeout)
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded(f"No budget left for '{self.name}'")
+
+        trial = self.state == self.HALF_OPEN
+        if trial:
+            self._trial_in_flight = True
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._record_timeout(budget_bound, trial)
+            raise DeadlineExceeded(f"'{self.name}' call exceeded {timeout:.3f}s")
+        except asyncio.CancelledError:
+            if trial:
+                self._trial_in_flight = False
+            raise
+        except self.deadline_errors:
+            self._record_timeout(budget_bound, trial)
+            raise
+        except Exception:
+            self.record_failure(trial)
+            raise
+        self.record_success(trial)
+        return result
+
+    def _record_timeout(self, budget_bound: bool, trial: bool):
+        if not budget_bound:
+            self.record_failure(trial)
+        elif trial:
+            # The caller ran out of time, not the dependency; let another trial through
+            self._trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        """
+        Current state and counters, for health reporting
+        """
+        failures = self._outcomes.count(False)
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": failures,
+            "rejected": self._rejected,
+        }
@@ -1,25 +1,76 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
 from datetime import datetime, timezone
-from email_service import send_contact_notification
+from email_service import send_contact_notification, email_breaker
+import leads
+import http_cache
+from http_cache import CompressionMiddleware, CompressionPolicy
+from profiling import CPROFILE, Profiler, ProfilingMiddleware
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    remaining_ms,
+    request_deadline,
+)
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Time budget for a whole request; Mongo and SMTP calls share what is left of it
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_TIMEOUT_SECONDS', '10'))
+# Callers may shorten the budget with X-Request-Timeout-Ms, but not below this
+MIN_REQUEST_TIMEOUT_SECONDS = float(os.environ.get('MIN_REQUEST_TIMEOUT_SECONDS', '1'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+# Upper bound for a single MongoDB call; only timeouts at this cap trip the breaker
+MONGO_CALL_TIMEOUT_SECONDS = float(os.environ.get('MONGO_CALL_TIMEOUT_SECONDS', '5'))
+# List version bumps get their own time limit instead of what is left of the request
+VERSION_BUMP_TIMEOUT_SECONDS = float(os.environ.get('VERSION_BUMP_TIMEOUT_SECONDS', '2'))
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+)
 db = client[os.environ['DB_NAME']]
 
+# Fail fast while MongoDB is unhealthy (e.g. during a primary election)
+mongo_breaker = CircuitBreaker(
+    "mongo",
+    failure_threshold=0.5,
+    window=20,
+    min_calls=5,
+    reset_timeout=15.0,
+    timeout=MONGO_CALL_TIMEOUT_SECONDS,
+    deadline_errors=(ExecutionTimeout,),
+)
+
+# Last successful list results, served while MongoDB is unavailable
+_list_cache = {}
+
+# On-demand profiling; disabled unless PROFILING_TOKEN is set
+profiler = Profiler(
+    output_dir=Path(os.environ.get('PROFILING_DIR', ROOT_DIR / 'profiles')),
+    token=os.environ.get('PROFILING_TOKEN', ''),
+    max_captures=int(os.environ.get('PROFILING_MAX_CAPTURES', '20')),
+    max_bytes=int(os.environ.get('PROFILING_MAX_BYTES', str(5 * 1024 * 1024))),
+    max_requests=int(os.environ.get('PROFILING_MAX_REQUESTS', '20')),
+)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -61,11 +112,105 @@ class ContactMessageUpdate(BaseModel):
     read: Optional[bool] = None
     replied: Optional[bool] = None
 
+# Lead Models (one per normalized email, maintained on write)
+class Lead(BaseModel):
+    model_config = ConfigDict(extra="ignore")  # Ignore MongoDB's _id field
+    
+    email: str
+    name: str
+    company: Optional[str] = None
+    message_count: int = 0
+    unread_count: int = 0
+    first_seen: datetime
+    last_seen: datetime
+    recent_message_ids: List[str] = []
+
+class LeadDetail(Lead):
+    messages: List[ContactMessage] = []
+
+# Profiling Models
+class ProfileArm(BaseModel):
+    route: str = Field(..., min_length=1)
+    count: int = Field(1, ge=1)
+    mode: Literal["cprofile", "sample"] = CPROFILE
+
+def _max_time_ms() -> int:
+    """
+    Remaining request budget, capped per call, to pass to MongoDB as maxTimeMS
+    """
+    return remaining_ms(default=REQUEST_TIMEOUT_SECONDS, cap=MONGO_CALL_TIMEOUT_SECONDS)
+
+def _unavailable(error: Exception) -> HTTPException:
+    """
+    Map a timeout or open circuit to the HTTP error returned to the client
+    """
+    if isinstance(error, (DeadlineExceeded, ExecutionTimeout)):
+        return HTTPException(status_code=504, detail="Upstream timeout")
+    return HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+UNAVAILABLE_ERRORS = (CircuitOpenError, DeadlineExceeded, ExecutionTimeout, ConnectionFailure)
+
+def _serve_cached(key: str, response: Response, error: Exception):
+    """
+    Return the last good list for key, or raise if there is none
+    """
+    if key not in _list_cache:
+        raise _unavailable(error)
+    logger.warning(f"Serving cached {key} list: {str(error)}")
+    if "etag" in response.headers:
+        del response.headers["etag"]
+    response.headers["X-Cache"] = "stale"
+    return _list_cache[key]
+
+async def _not_modified(name: str, request: Request, response: Response) -> Optional[Response]:
+    """
+    Tag a list response with its collection's version; return a 304 instead
+    when the client already holds that version
+    """
+    version = await mongo_breaker.call(http_cache.collection_version, db, name)
+    etag = http_cache.list_etag(name, version)
+    matched = http_cache.matching_etag(request.headers.get("if-none-match"), etag)
+    if matched:
+        return Response(status_code=304, headers={"ETag": matched, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return None
+
+async def _bump_versions(*names: str, required: bool = True):
+    """
+    Invalidate list ETags after a write
+
+    Runs after the write (bumping first would let a concurrent read cache the
+    old list under the new ETag), shielded from request cancellation and
+    with its own timeout rather than the leftover request budget. If it still
+    fails and `required` is set the caller gets an error: a success response
+    would leave clients revalidating stale lists with 304s. Otherwise the
+    failure is only logged.
+    """
+    try:
+        await asyncio.wait_for(
+            asyncio.shield(http_cache.bump_version(db, *names)),
+            timeout=VERSION_BUMP_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        logger.error(f"Failed to bump versions of {', '.join(names)}: {str(e)}")
+        if required:
+            raise HTTPException(status_code=503, detail="Saved, but list caches could not be refreshed")
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Hello World"}
 
+@api_router.get("/health")
+async def health():
+    """
+    Report circuit breaker states for MongoDB and SMTP
+    """
+    breakers = {b.name: b.snapshot() for b in (mongo_breaker, email_breaker)}
+    degraded = any(b["state"] != CircuitBreaker.CLOSED for b in breakers.values())
+    return {"status": "degraded" if degraded else "ok", "breakers": breakers}
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.model_dump()
@@ -75,19 +220,31 @@ async def create_status_check(input: StatusCheckCreate):
     doc = status_obj.model_dump()
     doc['timestamp'] = doc['timestamp'].isoformat()
     
-    _ = await db.status_checks.insert_one(doc)
+    try:
+        _ = await mongo_breaker.call(db.status_checks.insert_one, doc)
+    except UNAVAILABLE_ERRORS as e:
+        raise _unavailable(e)
+    await _bump_versions("status_checks")
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
+async def get_status_checks(request: Request, response: Response):
     # Exclude MongoDB's _id field from the query results
-    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
+    try:
+        not_modified = await _not_modified("status_checks", request, response)
+        if not_modified:
+            return not_modified
+        cursor = db.status_checks.find({}, {"_id": 0}).max_time_ms(_max_time_ms())
+        status_checks = await mongo_breaker.call(cursor.to_list, 1000)
+    except UNAVAILABLE_ERRORS as e:
+        return _serve_cached("status_checks", response, e)
     
     # Convert ISO string timestamps back to datetime objects
     for check in status_checks:
         if isinstance(check['timestamp'], str):
             check['timestamp'] = datetime.fromisoformat(check['timestamp'])
     
+    _list_cache["status_checks"] = status_checks
     return status_checks
 
 # Contact Message Endpoints
@@ -104,13 +261,28 @@ async def create_contact_message(contact: ContactMessageCreate):
         doc = contact_obj.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
         
+        # Public form: a cache refresh failure must not fail the submission
+        # (visitors retry and duplicate it), so bump on both sides of the
+        # write; a stale ETag then needs a read racing the insert and a
+        # failed second bump.
+        await _bump_versions("contact_messages", "leads", required=False)
+        
         # Insert into MongoDB
-        _ = await db.contact_messages.insert_one(doc)
+        _ = await mongo_breaker.call(db.contact_messages.insert_one, doc)
+        
+        # Keep the lead index in step; a rebuild repairs it if this fails
+        try:
+            await mongo_breaker.call(leads.record_message, db, doc)
+        except Exception as lead_error:
+            logger.error(f"Failed to update lead for {contact_obj.email}: {str(lead_error)}")
+        await _bump_versions("contact_messages", "leads", required=False)
         
         # Send email notification
         try:
             await send_contact_notification(contact_dict)
             logger.info(f"Email notification sent for contact from {contact_obj.email}")
+        except CircuitOpenError:
+            logger.warning(f"Email circuit open, skipped notification for {contact_obj.email}")
         except Exception as email_error:
             logger.error(f"Failed to send email notification: {str(email_error)}")
             # Continue even if email fails - message is still saved
@@ -119,24 +291,39 @@ async def create_contact_message(contact: ContactMessageCreate):
         logger.info(f"New contact message from {contact_obj.email}")
         
         return contact_obj
+    except HTTPException:
+        raise
+    except UNAVAILABLE_ERRORS as e:
+        logger.error(f"Error creating contact message: {str(e)}")
+        raise _unavailable(e)
     except Exception as e:
         logger.error(f"Error creating contact message: {str(e)}")
         raise HTTPException(status_code=500, detail="Error creating contact message")
 
 @api_router.get("/contact", response_model=List[ContactMessage])
-async def get_contact_messages():
+async def get_contact_messages(request: Request, response: Response):
     """
     Get all contact messages (for admin panel)
+
+    Returns 304 when If-None-Match carries the current ETag, and falls back
+    to the last successful result while MongoDB is unavailable.
     """
     try:
-        messages = await db.contact_messages.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+        not_modified = await _not_modified("contact_messages", request, response)
+        if not_modified:
+            return not_modified
+        cursor = db.contact_messages.find({}, {"_id": 0}).sort("created_at", -1).max_time_ms(_max_time_ms())
+        messages = await mongo_breaker.call(cursor.to_list, 1000)
         
         # Convert ISO string timestamps back to datetime objects
         for msg in messages:
             if isinstance(msg['created_at'], str):
                 msg['created_at'] = datetime.fromisoformat(msg['created_at'])
         
+        _list_cache["contact_messages"] = messages
         return messages
+    except UNAVAILABLE_ERRORS as e:
+        return _serve_cached("contact_messages", response, e)
     except Exception as e:
         logger.error(f"Error fetching contact messages: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching contact messages")
@@ -147,7 +334,12 @@ async def get_contact_message(contact_id: str):
     Get a specific contact message by ID
     """
     try:
-        message = await db.contact_messages.find_one({"id": contact_id}, {"_id": 0})
+        message = await mongo_breaker.call(
+            db.contact_messages.find_one,
+            {"id": contact_id},
+            {"_id": 0},
+            max_time_ms=_max_time_ms()
+        )
         if not message:
             raise HTTPException(status_code=404, detail="Contact message not found")
         
@@ -158,6 +350,9 @@ async def get_contact_message(contact_id: str):
         return ContactMessage(**message)
     except HTTPException:
         raise
+    except UNAVAILABLE_ERRORS as e:
+        logger.error(f"Error fetching contact message: {str(e)}")
+        raise _unavailable(e)
     except Exception as e:
         logger.error(f"Error fetching contact message: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching contact message")
@@ -174,16 +369,26 @@ async def update_contact_message(contact_id: str, update: ContactMessageUpdate):
         if not update_dict:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        # Update in MongoDB
-        result = await db.contact_messages.find_one_and_update(
+        # Update in MongoDB, keeping the previous state for the lead's unread count
+        before = await mongo_breaker.call(
+            db.contact_messages.find_one_and_update,
             {"id": contact_id},
             {"$set": update_dict},
-            return_document=True
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE,
+            maxTimeMS=_max_time_ms()
         )
         
-        if not result:
+        if not before:
             raise HTTPException(status_code=404, detail="Contact message not found")
         
+        result = {**before, **update_dict}
+        try:
+            await mongo_breaker.call(leads.record_update, db, before, result)
+        except Exception as lead_error:
+            logger.error(f"Failed to update lead for {result['email']}: {str(lead_error)}")
+        await _bump_versions("contact_messages", "leads")
+        
         # Convert ISO string timestamp back to datetime object
         if isinstance(result['created_at'], str):
             result['created_at'] = datetime.fromisoformat(result['created_at'])
@@ -191,10 +396,156 @@ async def update_contact_message(contact_id: str, update: ContactMessageUpdate):
         return ContactMessage(**result)
     except HTTPException:
         raise
+    except UNAVAILABLE_ERRORS as e:
+        logger.error(f"Error updating contact message: {str(e)}")
+        raise _unavailable(e)
     except Exception as e:
         logger.error(f"Error updating contact message: {str(e)}")
         raise HTTPException(status_code=500, detail="Error updating contact message")
 
+# Lead Endpoints
+def _lead_timestamps(lead: dict) -> dict:
+    # Convert ISO string timestamps back to datetime objects
+    for field in ('first_seen', 'last_seen'):
+        if isinstance(lead.get(field), str):
+            lead[field] = datetime.fromisoformat(lead[field])
+    return lead
+
+@api_router.get("/leads", response_model=List[Lead])
+async def get_leads(
+    request: Request,
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200)
+):
+    """
+    List leads, most recently active first (for admin panel)
+    """
+    try:
+        not_modified = await _not_modified("leads", request, response)
+        if not_modified:
+            return not_modified
+        cursor = (
+            db.leads.find({}, {"_id": 0})
+            .sort("last_seen", -1)
+            .skip(skip)
+            .limit(limit)
+            .max_time_ms(_max_time_ms())
+        )
+        lead_docs = await mongo_breaker.call(cursor.to_list, limit)
+        return [_lead_timestamps(lead) for lead in lead_docs]
+    except UNAVAILABLE_ERRORS as e:
+        logger.error(f"Error fetching leads: {str(e)}")
+        raise _unavailable(e)
+    except Exception as e:
+        logger.error(f"Error fetching leads: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching leads")
+
+@api_router.get("/leads/{email}", response_model=LeadDetail)
+async def get_lead(email: str):
+    """
+    Get a lead by email together with its most recent messages
+    """
+    try:
+        lead = await mongo_breaker.call(
+            db.leads.find_one,
+            {"email": leads.normalize_email(email)},
+            {"_id": 0},
+            max_time_ms=_max_time_ms()
+        )
+        if not lead:
+            raise HTTPException(status_code=404, detail="Lead not found")
+        
+        cursor = db.contact_messages.find(
+            {"id": {"$in": lead.get('recent_message_ids', [])}}, {"_id": 0}
+        ).sort("created_at", -1).max_time_ms(_max_time_ms())
+        messages = await mongo_breaker.call(cursor.to_list, leads.RECENT_MESSAGES)
+        for msg in messages:
+            if isinstance(msg['created_at'], str):
+                msg['created_at'] = datetime.fromisoformat(msg['created_at'])
+        
+        return LeadDetail(**_lead_timestamps(lead), messages=messages)
+    except HTTPException:
+        raise
+    except UNAVAILABLE_ERRORS as e:
+        logger.error(f"Error fetching lead: {str(e)}")
+        raise _unavailable(e)
+    except Exception as e:
+        logger.error(f"Error fetching lead: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error fetching lead")
+
+@api_router.post("/leads/rebuild")
+async def rebuild_leads():
+    """
+    Recompute the leads collection from all contact messages
+
+    Bounded by the request budget; large collections should be rebuilt
+    offline with `python leads.py` while contact writes are paused.
+    """
+    try:
+        count = await mongo_breaker.call(leads.rebuild_leads, db, max_time_ms=_max_time_ms())
+        await _bump_versions("leads")
+        logger.info(f"Rebuilt leads collection: {count} leads")
+        return {"leads": count}
+    except HTTPException:
+        raise
+    except UNAVAILABLE_ERRORS as e:
+        logger.error(f"Error rebuilding leads: {str(e)}")
+        raise _unavailable(e)
+    except Exception as e:
+        logger.error(f"Error rebuilding leads: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error rebuilding leads")
+
+# Admin profiling endpoints
+def _require_profiler_token(token: Optional[str]):
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+@api_router.get("/admin/profile")
+async def get_profiling_status(x_profile_token: Optional[str] = Header(None)):
+    """
+    Show armed routes and the number of captures on disk
+    """
+    _require_profiler_token(x_profile_token)
+    return profiler.status()
+
+@api_router.post("/admin/profile")
+async def arm_profiling(arm: ProfileArm, x_profile_token: Optional[str] = Header(None)):
+    """
+    Profile the next `count` requests to `route` (exact request path)
+    """
+    _require_profiler_token(x_profile_token)
+    armed = profiler.arm(arm.route, arm.count, arm.mode)
+    logger.info(f"Profiling armed for {arm.route}: {armed}")
+    return {"route": arm.route, **armed}
+
+@api_router.delete("/admin/profile")
+async def disarm_profiling(route: Optional[str] = None, x_profile_token: Optional[str] = Header(None)):
+    """
+    Disarm one route, or all routes when none is given
+    """
+    _require_profiler_token(x_profile_token)
+    profiler.disarm(route)
+    return profiler.status()
+
+@app.middleware("http")
+async def apply_request_deadline(request: Request, call_next):
+    """
+    Give each request a deadline budget, optionally shortened by the caller
+    via the X-Request-Timeout-Ms header (never below MIN_REQUEST_TIMEOUT_SECONDS)
+    """
+    budget = REQUEST_TIMEOUT_SECONDS
+    header = request.headers.get("x-request-timeout-ms")
+    if header:
+        try:
+            budget = min(budget, max(float(header) / 1000, MIN_REQUEST_TIMEOUT_SECONDS))
+        except ValueError:
+            pass
+    with request_deadline(budget):
+        return await call_next(request)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -206,6 +557,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress the list endpoints; levels picked with compression_bench.py.
+# /api/contact can reach ~2MB, where level 5 keeps CPU per response low;
+# the smaller lead/status lists can afford level 6.
+app.add_middleware(CompressionMiddleware, routes={
+    "/api/contact": CompressionPolicy(minimum_size=1024, gzip_level=5, brotli_quality=5),
+    "/api/leads": CompressionPolicy(minimum_size=1024, gzip_level=6, brotli_quality=6),
+    "/api/status": CompressionPolicy(minimum_size=1024, gzip_level=6, brotli_quality=6),
+})
+
+# Outermost, so captures cover every other middleware and the handlers
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -213,6 +576,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def prepare_collections():
+    try:
+        await leads.ensure_indexes(db)
+        # Deployments that predate the leads collection get it built once
+        count = await leads.backfill_if_empty(db)
+        if count is not None:
+            await _bump_versions("leads")
+            logger.info(f"Backfilled leads collection: {count} leads")
+    except Exception as e:
+        logger.error(f"Error preparing collections: {str(e)}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
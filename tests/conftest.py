@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py reads these at import time; Motor connects lazily, so nothing is contacted
+os.environ.setdefault("MONGO_URL", "mongodb://127.0.0.1:1")
+os.environ.setdefault("DB_NAME", "landing_test")
+os.environ.setdefault("EMAIL_FROM", "owner@example.com")
+
+import email_service  # noqa: E402
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from resilience import CircuitBreaker  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def sent_emails(monkeypatch):
+    """
+    Stub SMTP: records messages instead of sending them
+    """
+    sent = []
+
+    async def send_message(message):
+        sent.append(message)
+
+    monkeypatch.setattr(email_service.fast_mail, "send_message", send_message)
+    return sent
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    """
+    Fresh breakers per test, with small windows so they trip quickly
+    """
+    mongo = CircuitBreaker(
+        "mongo",
+        min_calls=2,
+        window=4,
+        reset_timeout=60.0,
+        timeout=server.MONGO_CALL_TIMEOUT_SECONDS,
+        deadline_errors=server.mongo_breaker.deadline_errors,
+    )
+    smtp = CircuitBreaker(
+        "smtp",
+        min_calls=2,
+        window=4,
+        reset_timeout=60.0,
+        timeout=email_service.SMTP_TIMEOUT_SECONDS,
+    )
+    monkeypatch.setattr(server, "mongo_breaker", mongo)
+    monkeypatch.setattr(server, "email_breaker", smtp)
+    monkeypatch.setattr(email_service, "email_breaker", smtp)
+    return mongo, smtp
+
+
+@pytest.fixture
+def db(monkeypatch, breakers, sent_emails):
+    """
+    In-memory stand-in for the Motor database
+    """
+    database = AsyncMongoMockClient()["landing_test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "_list_cache", {})
+    return database
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(server.app)
+
+
+class FaultyCollection:
+    """
+    Stand-in for a Motor collection that can be slow, hang or fail,
+    and records the maxTimeMS values it is given
+    """
+
+    def __init__(self, docs=None, delay=0.0, error=None):
+        self.docs = docs or []
+        self.delay = delay
+        self.error = error
+        self.max_time_ms_seen = []
+
+    async def _respond(self, result):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return result
+
+    def find(self, *args, **kwargs):
+        return self
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def max_time_ms(self, ms):
+        self.max_time_ms_seen.append(ms)
+        return self
+
+    def to_list(self, length):
+        return self._respond([dict(doc) for doc in self.docs])
+
+    def find_one(self, *args, max_time_ms=None, **kwargs):
+        self.max_time_ms_seen.append(max_time_ms)
+        return self._respond(dict(self.docs[0]) if self.docs else None)
+
+    def insert_one(self, doc):
+        return self._respond(None)
@@ -0,0 +1,228 @@
+import asyncio
+import gzip
+from types import SimpleNamespace
+
+import brotli
+import pytest
+
+import http_cache
+import server
+from http_cache import CompressionMiddleware, CompressionPolicy, matching_etag, negotiate_encoding
+from resilience import request_deadline
+
+POLICY = CompressionPolicy(minimum_size=100, gzip_level=6, brotli_quality=4)
+BIG = b'{"message":"' + b"hola " * 200 + b'"}'
+
+
+# negotiate_encoding
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("GZIP, deflate", "gzip"),
+    ("gzip;q=1, br;q=0.5", "gzip"),
+    ("gzip;q=0.2, br;q=0.8", "br"),
+    ("br;q=0, gzip;q=0", None),
+    ("br;q=0", None),
+    ("*", "br"),
+    ("*;q=0.5, br;q=0", "gzip"),
+    ("gzip;q=bogus, br", "br"),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+# matching_etag
+def test_matching_etag_accepts_coding_suffixes():
+    etag = '"contact_messages-v3"'
+    assert matching_etag(None, etag) is None
+    assert matching_etag('"contact_messages-v3"', etag) == etag
+    assert matching_etag('"contact_messages-v3-gzip"', etag) == '"contact_messages-v3-gzip"'
+    assert matching_etag('"other", "contact_messages-v3-br"', etag) == '"contact_messages-v3-br"'
+    assert matching_etag("*", etag) == etag
+
+
+def test_matching_etag_rejects_other_versions():
+    etag = '"contact_messages-v3"'
+    assert matching_etag('"contact_messages-v2"', etag) is None
+    assert matching_etag('"contact_messages-v2-gzip"', etag) is None
+    assert matching_etag('"contact_messages-v3-deflate"', etag) is None
+    assert matching_etag('W/"contact_messages-v3"', etag) is None
+
+
+# CompressionMiddleware
+def run_middleware(chunks, accept_encoding="gzip", status=200, headers=None, path="/list"):
+    """
+    Send `chunks` through CompressionMiddleware and return the ASGI messages
+    """
+    sent = []
+    response_headers = [(b"content-type", b"application/json")] + (headers or [])
+    if len(chunks) == 1:
+        response_headers.append((b"content-length", str(len(chunks[0])).encode()))
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": list(response_headers)})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "path": path,
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    asyncio.run(CompressionMiddleware(app, {"/list": POLICY})(scope, None, send))
+    return sent
+
+
+def headers_of(start):
+    return {k.decode(): v.decode() for k, v in start["headers"]}
+
+
+def body_of(messages):
+    return b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+
+
+def test_small_body_passes_through():
+    start, *body = run_middleware([b'{"ok":true}'])
+    headers = headers_of(start)
+    assert "content-encoding" not in headers
+    assert headers["content-length"] == "11"
+    assert headers["vary"] == "Accept-Encoding"
+    assert body_of(body) == b'{"ok":true}'
+
+
+def test_small_streamed_body_is_buffered_then_passed_through():
+    start, *body = run_middleware([b'{"ok":', b"true}", b""])
+    assert "content-encoding" not in headers_of(start)
+    assert body_of(body) == b'{"ok":true}'
+
+
+def test_single_chunk_is_compressed_with_new_length_and_etag():
+    start, *body = run_middleware([BIG], headers=[(b"etag", b'"list-v1"')])
+    headers = headers_of(start)
+    compressed = body_of(body)
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(compressed))
+    assert headers["etag"] == '"list-v1-gzip"'
+    assert gzip.decompress(compressed) == BIG
+
+
+def test_streamed_chunks_stay_streamed_without_content_length():
+    chunks = [BIG[:400], BIG[400:800], BIG[800:], b""]
+    start, *body = run_middleware(chunks, accept_encoding="br", headers=[(b"content-length", b"9999")])
+    headers = headers_of(start)
+    assert headers["content-encoding"] == "br"
+    assert "content-length" not in headers
+    assert len(body) > 1
+    assert body[-1]["more_body"] is False
+    assert all(m["more_body"] for m in body[:-1])
+    assert brotli.decompress(body_of(body)) == BIG
+
+
+def test_weak_etag_is_left_alone():
+    start, *_ = run_middleware([BIG], headers=[(b"etag", b'W/"list-v1"')])
+    assert headers_of(start)["etag"] == 'W/"list-v1"'
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"status": 404},
+    {"status": 304},
+    {"accept_encoding": "identity"},
+    {"headers": [(b"content-encoding", b"gzip")]},
+    {"path": "/other"},
+])
+def test_passthrough_cases(kwargs):
+    start, *body = run_middleware([BIG], **kwargs)
+    headers = headers_of(start)
+    assert headers.get("content-encoding") in (None, "gzip")
+    assert body_of(body) == BIG
+
+
+# Conditional GET on list endpoints
+def test_unchanged_list_returns_304_without_querying(client, db, monkeypatch):
+    client.post("/api/contact", json={"name": "Ana", "email": "ana@example.com", "message": "Hola"})
+    first = client.get("/api/contact", headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+
+    def fail_find(*args, **kwargs):
+        raise AssertionError("list was queried")
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(
+        contact_messages=SimpleNamespace(find=fail_find),
+        collection_versions=db.collection_versions,
+    ))
+    revalidated = client.get("/api/contact", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert revalidated.content == b""
+
+
+def test_writes_change_list_etags(client):
+    before = {path: client.get(path).headers["etag"] for path in ("/api/contact", "/api/leads", "/api/status")}
+    created = client.post("/api/contact", json={"name": "Ana", "email": "ana@example.com", "message": "Hola"})
+    assert client.get("/api/contact", headers={"If-None-Match": before["/api/contact"]}).status_code == 200
+    assert client.get("/api/leads", headers={"If-None-Match": before["/api/leads"]}).status_code == 200
+
+    etag = client.get("/api/contact").headers["etag"]
+    client.patch(f"/api/contact/{created.json()['id']}", json={"read": True})
+    assert client.get("/api/contact", headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/api/status", json={"client_name": "monitor"})
+    assert client.get("/api/status", headers={"If-None-Match": before["/api/status"]}).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_version_bump_ignores_exhausted_request_budget(db):
+    with request_deadline(0):
+        await server._bump_versions("contact_messages")
+    assert await http_cache.collection_version(db, "contact_messages") == 1
+
+
+def test_failed_version_bump_does_not_fail_contact_form(client, db, sent_emails, monkeypatch):
+    async def failing_bump(db, *names):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(http_cache, "bump_version", failing_bump)
+    response = client.post("/api/contact", json={"name": "Ana", "email": "ana@example.com", "message": "Hola"})
+    assert response.status_code == 201
+    assert len(sent_emails) == 1
+    assert asyncio.run(db.contact_messages.count_documents({})) == 1
+    assert asyncio.run(db.leads.find_one({"email": "ana@example.com"}))["message_count"] == 1
+
+
+def test_contact_etag_changes_when_only_the_first_bump_succeeds(client, monkeypatch):
+    etag = client.get("/api/contact").headers["etag"]
+    bump_version = http_cache.bump_version
+    calls = []
+
+    async def second_bump_fails(db, *names):
+        calls.append(names)
+        if len(calls) > 1:
+            raise ConnectionError("down")
+        await bump_version(db, *names)
+
+    monkeypatch.setattr(http_cache, "bump_version", second_bump_fails)
+    client.post("/api/contact", json={"name": "Ana", "email": "ana@example.com", "message": "Hola"})
+    assert len(calls) == 2
+    assert client.get("/api/contact", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_failed_version_bump_is_reported_for_admin_writes(client, monkeypatch):
+    async def failing_bump(db, *names):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(http_cache, "bump_version", failing_bump)
+    assert client.post("/api/status", json={"client_name": "monitor"}).status_code == 503
+
+
+def test_slow_version_bump_times_out(client, monkeypatch):
+    async def slow_bump(db, *names):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(http_cache, "bump_version", slow_bump)
+    monkeypatch.setattr(server, "VERSION_BUMP_TIMEOUT_SECONDS", 0.05)
+    assert client.post("/api/status", json={"client_name": "monitor"}).status_code == 503
@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+import leads
+import server
+from fastapi.testclient import TestClient
+
+
+def message(id, email="Ana@Example.com ", company=None, created_at="2025-01-01T00:00:00+00:00", read=False):
+    return {
+        "id": id,
+        "name": f"Ana {id}",
+        "email": email,
+        "company": company,
+        "message": "Hola",
+        "created_at": created_at,
+        "read": read,
+        "replied": False,
+    }
+
+
+def stamp(i):
+    return f"2025-01-{i + 1:02d}T00:00:00+00:00"
+
+
+# Write-path maintenance
+@pytest.mark.anyio
+async def test_record_message_aggregates_by_normalized_email(db):
+    await leads.record_message(db, message("m1", company="Acme", created_at=stamp(1)))
+    await leads.record_message(db, message("m2", email="ana@example.com", created_at=stamp(3)))
+    await leads.record_message(db, message("m0", company="Old Co", created_at=stamp(0), read=True))
+
+    (lead,) = await db.leads.find({}, {"_id": 0}).to_list(None)
+    assert lead["email"] == "ana@example.com"
+    assert lead["message_count"] == 3
+    assert lead["unread_count"] == 2
+    assert lead["first_seen"] == stamp(0)
+    assert lead["last_seen"] == stamp(3)
+    assert lead["recent_message_ids"] == ["m0", "m2", "m1"]
+
+
+@pytest.mark.anyio
+async def test_latest_company_wins_and_missing_company_keeps_it(db):
+    await leads.record_message(db, message("m1", company="Acme"))
+    await leads.record_message(db, message("m2", company="Globex"))
+    await leads.record_message(db, message("m3"))
+
+    lead = await db.leads.find_one({"email": "ana@example.com"})
+    assert lead["company"] == "Globex"
+
+
+@pytest.mark.anyio
+async def test_recent_message_ids_are_capped(db):
+    for i in range(leads.RECENT_MESSAGES + 5):
+        await leads.record_message(db, message(f"m{i}"))
+
+    lead = await db.leads.find_one({"email": "ana@example.com"})
+    assert lead["message_count"] == leads.RECENT_MESSAGES + 5
+    assert len(lead["recent_message_ids"]) == leads.RECENT_MESSAGES
+    assert lead["recent_message_ids"][0] == f"m{leads.RECENT_MESSAGES + 4}"
+
+
+@pytest.mark.anyio
+async def test_record_update_moves_unread_count_both_ways(db):
+    unread = message("m1")
+    await leads.record_message(db, unread)
+    read = {**unread, "read": True}
+
+    await leads.record_update(db, unread, read)
+    assert (await db.leads.find_one({}))["unread_count"] == 0
+    await leads.record_update(db, read, {**read, "replied": True})
+    assert (await db.leads.find_one({}))["unread_count"] == 0
+    await leads.record_update(db, read, unread)
+    assert (await db.leads.find_one({}))["unread_count"] == 1
+
+
+@pytest.mark.anyio
+async def test_backfill_only_runs_for_an_empty_leads_collection(db, monkeypatch):
+    calls = []
+
+    async def fake_rebuild(database, max_time_ms=None):
+        calls.append(max_time_ms)
+        return 1
+
+    monkeypatch.setattr(leads, "rebuild_leads", fake_rebuild)
+    assert await leads.backfill_if_empty(db) is None
+
+    await db.contact_messages.insert_one(message("m1"))
+    assert await leads.backfill_if_empty(db) == 1
+
+    await db.leads.insert_one({"email": "ana@example.com"})
+    assert await leads.backfill_if_empty(db) is None
+    assert len(calls) == 1
+
+
+def test_rebuild_pipeline_bounds_group_state():
+    group = leads.rebuild_pipeline()[1]["$group"]
+    assert "$push" not in str(group)
+    assert group["recent_message_ids"]["$firstN"]["n"] == leads.RECENT_MESSAGES
+
+
+# Endpoints
+def submit(client, **overrides):
+    body = {"name": "Ana", "email": "ana@example.com", "message": "Hola", **overrides}
+    response = client.post("/api/contact", json=body)
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_contact_endpoints_maintain_leads(client):
+    first = submit(client, company="Acme")
+    submit(client, email="ANA@example.com")
+    submit(client, email="bob@example.com")
+
+    assert client.patch(f"/api/contact/{first['id']}", json={"read": True}).status_code == 200
+    assert client.patch(f"/api/contact/{first['id']}", json={"read": True}).status_code == 200
+
+    by_email = {lead["email"]: lead for lead in client.get("/api/leads").json()}
+    ana = by_email["ana@example.com"]
+    assert ana["message_count"] == 2
+    assert ana["unread_count"] == 1
+    assert ana["company"] == "Acme"
+    assert by_email["bob@example.com"]["unread_count"] == 1
+
+
+def test_leads_are_paginated_most_recent_first(client):
+    for i in range(3):
+        submit(client, email=f"lead{i}@example.com")
+
+    first_page = client.get("/api/leads", params={"limit": 2}).json()
+    second_page = client.get("/api/leads", params={"skip": 2, "limit": 2}).json()
+    assert [lead["email"] for lead in first_page] == ["lead2@example.com", "lead1@example.com"]
+    assert [lead["email"] for lead in second_page] == ["lead0@example.com"]
+    assert client.get("/api/leads", params={"limit": 500}).status_code == 422
+
+
+def test_lead_detail_includes_recent_messages(client):
+    ids = [submit(client, message=f"Hola {i}")["id"] for i in range(3)]
+
+    response = client.get("/api/leads/ANA@example.com")
+    assert response.status_code == 200
+    detail = response.json()
+    assert detail["recent_message_ids"] == ids[::-1]
+    assert [msg["id"] for msg in detail["messages"]] == ids[::-1]
+    assert client.get("/api/leads/nobody@example.com").status_code == 404
+
+
+def test_rebuild_endpoint_passes_max_time_ms(client, monkeypatch):
+    seen = []
+
+    async def fake_rebuild(database, max_time_ms=None):
+        seen.append(max_time_ms)
+        return 0
+
+    monkeypatch.setattr(leads, "rebuild_leads", fake_rebuild)
+    assert client.post("/api/leads/rebuild").json() == {"leads": 0}
+    assert 0 < seen[0] <= server.MONGO_CALL_TIMEOUT_SECONDS * 1000
+
+
+def test_startup_backfills_existing_deployments(db, monkeypatch):
+    async def fake_rebuild(database, max_time_ms=None):
+        await database.leads.insert_one({"email": "ana@example.com"})
+        return 1
+
+    monkeypatch.setattr(leads, "rebuild_leads", fake_rebuild)
+    asyncio.run(db.contact_messages.insert_one(message("m1")))
+    with TestClient(server.app):
+        pass
+    assert asyncio.run(db.leads.find_one({"email": "ana@example.com"})) is not None
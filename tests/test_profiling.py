@@ -0,0 +1,100 @@
+import marshal
+
+import pytest
+
+import server
+from profiling import CPROFILE, SAMPLE, Profiler
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def profiler(monkeypatch, tmp_path):
+    monkeypatch.setattr(server.profiler, "token", TOKEN)
+    monkeypatch.setattr(server.profiler, "output_dir", tmp_path)
+    monkeypatch.setattr(server.profiler, "max_captures", 3)
+    monkeypatch.setattr(server.profiler, "_armed", {})
+    return server.profiler
+
+
+def scope(path="/api/contact", **headers):
+    return {
+        "type": "http",
+        "path": path,
+        "headers": [(k.replace("_", "-").encode(), v) for k, v in headers.items()],
+    }
+
+
+def test_authorized_compares_tokens():
+    profiler = Profiler(output_dir="unused", token=TOKEN)
+    assert profiler.authorized(TOKEN)
+    assert not profiler.authorized("wrong")
+    assert not profiler.authorized(None)
+    assert not profiler.authorized("caf\xe9")
+    assert not profiler.authorized("€")
+    assert not Profiler(output_dir="unused").authorized("")
+
+
+def test_non_ascii_configured_token_matches_raw_header_bytes():
+    profiler = Profiler(output_dir="unused", token="caf\xe9")
+    header = "caf\xe9".encode().decode("latin-1")
+    assert profiler.authorized(header)
+
+
+def test_claim_requires_mode_and_token():
+    profiler = Profiler(output_dir="unused", token=TOKEN)
+    assert profiler.claim(scope(x_profile_token=TOKEN.encode())) is None
+    assert profiler.claim(scope(x_profile=b"cprofile", x_profile_token=b"nope")) is None
+    assert profiler.claim(scope(x_profile=b"bogus", x_profile_token=TOKEN.encode())) is None
+    assert profiler.claim(scope(x_profile=b"sample", x_profile_token=TOKEN.encode())) == SAMPLE
+
+
+def test_claim_counts_down_armed_routes():
+    profiler = Profiler(output_dir="unused", token=TOKEN, max_requests=2)
+    assert profiler.arm("/api/contact", 5)["remaining"] == 2
+    assert profiler.claim(scope()) == CPROFILE
+    assert profiler.claim(scope()) == CPROFILE
+    assert profiler.claim(scope()) is None
+    assert profiler.claim(scope("/api/status")) is None
+
+
+def test_non_ascii_token_header_does_not_500(client, profiler):
+    headers = {"X-Profile": "cprofile", "X-Profile-Token": b"caf\xe9"}
+    assert client.get("/api/", headers=headers).status_code == 200
+    assert client.get("/api/admin/profile", headers={"X-Profile-Token": b"caf\xe9"}).status_code == 403
+    assert not list(profiler.output_dir.iterdir())
+
+
+def test_admin_endpoints_require_token(client, profiler, monkeypatch):
+    assert client.get("/api/admin/profile").status_code == 403
+    monkeypatch.setattr(profiler, "token", "")
+    assert client.get("/api/admin/profile", headers={"X-Profile-Token": TOKEN}).status_code == 404
+
+
+def test_armed_route_writes_pstats(client, profiler):
+    headers = {"X-Profile-Token": TOKEN}
+    armed = client.post("/api/admin/profile", headers=headers, json={"route": "/api/contact", "count": 1})
+    assert armed.json()["remaining"] == 1
+
+    client.post("/api/contact", json={"name": "Ana", "email": "ana@example.com", "message": "Hola"})
+    client.post("/api/contact", json={"name": "Ana", "email": "ana@example.com", "message": "Hola"})
+
+    captures = list(profiler.output_dir.iterdir())
+    assert [p.suffix for p in captures] == [".prof"]
+    stats = marshal.loads(captures[0].read_bytes())
+    assert any(func == "create_contact_message" for (_, _, func) in stats)
+    assert any(func == "send_contact_notification" for (_, _, func) in stats)
+
+
+def test_header_sampling_writes_collapsed_stacks(client, profiler):
+    headers = {"X-Profile": "sample", "X-Profile-Token": TOKEN}
+    assert client.get("/api/contact", headers=headers).status_code == 200
+    (capture,) = profiler.output_dir.iterdir()
+    assert capture.suffix == ".folded"
+
+
+def test_capture_count_is_capped(client, profiler):
+    headers = {"X-Profile": "cprofile", "X-Profile-Token": TOKEN}
+    for _ in range(5):
+        client.get("/api/contact", headers=headers)
+    assert len(list(profiler.output_dir.iterdir())) == 3
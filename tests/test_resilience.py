@@ -0,0 +1,296 @@
+import asyncio
+import copy
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+
+import email_service
+import server
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, request_deadline
+from tests.conftest import FaultyCollection
+
+CONTACT = {
+    "id": "c-1",
+    "name": "Ana",
+    "email": "ana@example.com",
+    "company": None,
+    "message": "Hola",
+    "created_at": "2025-01-27T20:00:00+00:00",
+    "read": False,
+    "replied": False,
+}
+
+
+async def ok():
+    return "ok"
+
+
+async def boom():
+    raise ConnectionFailure("down")
+
+
+async def hang():
+    await asyncio.sleep(5)
+
+
+# CircuitBreaker
+@pytest.mark.anyio
+async def test_breaker_opens_once_failure_ratio_is_reached():
+    breaker = CircuitBreaker("dep", failure_threshold=0.5, window=4, min_calls=2)
+    assert await breaker.call(ok) == "ok"
+    with pytest.raises(ConnectionFailure):
+        await breaker.call(boom)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(ok)
+    assert breaker.snapshot()["rejected"] == 1
+
+
+@pytest.mark.anyio
+async def test_breaker_half_open_trial_success_closes():
+    breaker = CircuitBreaker("dep", window=2, min_calls=1, reset_timeout=0.05)
+    with pytest.raises(ConnectionFailure):
+        await breaker.call(boom)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert await breaker.call(ok) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["recent_failures"] == 0
+
+
+@pytest.mark.anyio
+async def test_breaker_half_open_trial_failure_reopens():
+    breaker = CircuitBreaker("dep", window=2, min_calls=1, reset_timeout=0.05)
+    with pytest.raises(ConnectionFailure):
+        await breaker.call(boom)
+    await asyncio.sleep(0.06)
+
+    with pytest.raises(ConnectionFailure):
+        await breaker.call(boom)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(ok)
+
+
+@pytest.mark.anyio
+async def test_breaker_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker("dep", window=2, min_calls=1, reset_timeout=0.05)
+    with pytest.raises(ConnectionFailure):
+        await breaker.call(boom)
+    await asyncio.sleep(0.06)
+
+    async def slow_ok():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    trial = asyncio.ensure_future(breaker.call(slow_ok))
+    await asyncio.sleep(0)
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(ok)
+    assert await trial == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.anyio
+async def test_late_outcomes_do_not_extend_open_or_skip_the_trial():
+    breaker = CircuitBreaker("dep", window=4, min_calls=1, reset_timeout=0.05)
+    while_open, while_half_open, trial_done = asyncio.Event(), asyncio.Event(), asyncio.Event()
+
+    async def late(gate, outcome):
+        await gate.wait()
+        if outcome == "fail":
+            raise ConnectionFailure("late")
+        return outcome
+
+    stragglers = [
+        asyncio.ensure_future(breaker.call(late, gate, outcome))
+        for gate in (while_open, while_half_open)
+        for outcome in ("fail", "ok")
+    ]
+    await asyncio.sleep(0)
+    with pytest.raises(ConnectionFailure):
+        await breaker.call(boom)
+    opened_at = breaker._opened_at
+
+    # Stragglers finishing while open do not restart the reset timer
+    while_open.set()
+    await asyncio.sleep(0)
+    assert breaker._opened_at == opened_at
+    await asyncio.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # Stragglers finishing during the trial neither decide it nor free it up
+    trial = asyncio.ensure_future(breaker.call(late, trial_done, "ok"))
+    await asyncio.sleep(0)
+    while_half_open.set()
+    await asyncio.gather(*stragglers, return_exceptions=True)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(ok)
+
+    trial_done.set()
+    assert await trial == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.anyio
+async def test_timeout_at_dependency_cap_counts_as_failure():
+    breaker = CircuitBreaker("dep", window=2, min_calls=1, timeout=0.02)
+    with request_deadline(5):
+        with pytest.raises(DeadlineExceeded):
+            await breaker.call(hang)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.anyio
+async def test_timeout_from_caller_budget_is_not_a_failure():
+    breaker = CircuitBreaker("dep", window=2, min_calls=1, timeout=5, deadline_errors=(ExecutionTimeout,))
+    with request_deadline(0.02):
+        with pytest.raises(DeadlineExceeded):
+            await breaker.call(hang)
+
+    async def server_side_timeout():
+        raise ExecutionTimeout("operation exceeded time limit")
+
+    with request_deadline(0.5):
+        with pytest.raises(ExecutionTimeout):
+            await breaker.call(server_side_timeout)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["recent_calls"] == 0
+
+
+@pytest.mark.anyio
+async def test_exhausted_budget_fails_fast_without_calling():
+    breaker = CircuitBreaker("dep")
+    called = []
+
+    async def record():
+        called.append(True)
+
+    with request_deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            await breaker.call(record)
+    assert not called
+
+
+# Endpoints under fault injection
+def use_collection(monkeypatch, db, collection):
+    monkeypatch.setattr(server, "db", SimpleNamespace(
+        contact_messages=collection,
+        collection_versions=db.collection_versions,
+        leads=db.leads,
+    ))
+
+
+def test_list_falls_back_to_stale_cache(client, db, monkeypatch, breakers):
+    collection = FaultyCollection(docs=[CONTACT])
+    use_collection(monkeypatch, db, collection)
+    fresh = client.get("/api/contact")
+    assert fresh.status_code == 200
+    assert "x-cache" not in fresh.headers
+
+    collection.error = ConnectionFailure("primary election")
+    stale = client.get("/api/contact")
+    assert stale.status_code == 200
+    assert stale.headers["x-cache"] == "stale"
+    assert "etag" not in stale.headers
+    assert stale.json() == fresh.json()
+
+
+def test_list_without_cache_returns_503(client, db, monkeypatch):
+    use_collection(monkeypatch, db, FaultyCollection(error=ConnectionFailure("down")))
+    assert client.get("/api/contact").status_code == 503
+
+
+def test_open_breaker_returns_503(client, db, monkeypatch, breakers):
+    mongo, _ = breakers
+    use_collection(monkeypatch, db, FaultyCollection(error=ConnectionFailure("down")))
+    for _ in range(2):
+        client.get("/api/contact/c-1")
+    assert mongo.state == CircuitBreaker.OPEN
+
+    response = client.get("/api/contact/c-1")
+    assert response.status_code == 503
+    assert client.get("/api/health").json()["breakers"]["mongo"]["state"] == "open"
+
+
+def test_timeout_returns_504(client, db, monkeypatch, breakers):
+    mongo, _ = breakers
+    mongo.timeout = 0.05
+    use_collection(monkeypatch, db, FaultyCollection(docs=[CONTACT], delay=1))
+    assert client.get("/api/contact/c-1").status_code == 504
+
+
+def test_server_side_execution_timeout_returns_504(client, db, monkeypatch):
+    use_collection(monkeypatch, db, FaultyCollection(error=ExecutionTimeout("exceeded")))
+    assert client.get("/api/contact/c-1").status_code == 504
+
+
+def test_short_caller_budgets_cannot_open_breaker(client, db, monkeypatch, breakers):
+    mongo, _ = breakers
+    use_collection(monkeypatch, db, FaultyCollection(delay=0.02))
+    for _ in range(12):
+        response = client.get("/api/contact/nope", headers={"X-Request-Timeout-Ms": "5"})
+        assert response.status_code == 404
+    assert mongo.state == CircuitBreaker.CLOSED
+
+
+def test_budget_timeouts_do_not_open_breaker_without_clamp(client, db, monkeypatch, breakers):
+    mongo, _ = breakers
+    monkeypatch.setattr(server, "MIN_REQUEST_TIMEOUT_SECONDS", 0.0)
+    use_collection(monkeypatch, db, FaultyCollection(delay=0.02))
+    for _ in range(12):
+        response = client.get("/api/contact/nope", headers={"X-Request-Timeout-Ms": "5"})
+        assert response.status_code == 504
+    assert mongo.state == CircuitBreaker.CLOSED
+    assert client.get("/api/contact/nope").status_code == 404
+
+
+def test_max_time_ms_is_passed_to_motor(client, db, monkeypatch):
+    collection = FaultyCollection(docs=[CONTACT])
+    use_collection(monkeypatch, db, collection)
+    client.get("/api/contact")
+    client.get("/api/contact/c-1", headers={"X-Request-Timeout-Ms": "2000"})
+
+    list_ms, get_ms = collection.max_time_ms_seen
+    assert 0 < list_ms <= server.MONGO_CALL_TIMEOUT_SECONDS * 1000
+    assert 0 < get_ms <= 2000
+
+
+def test_email_is_skipped_while_smtp_breaker_is_open(client, breakers, monkeypatch):
+    _, smtp = breakers
+    attempts = []
+
+    async def failing_send(message):
+        attempts.append(message)
+        raise ConnectionFailure("smtp down")
+
+    monkeypatch.setattr(email_service.fast_mail, "send_message", failing_send)
+    body = {"name": "Ana", "email": "ana@example.com", "message": "Hola"}
+    for _ in range(2):
+        assert client.post("/api/contact", json=body).status_code == 201
+    assert smtp.state == CircuitBreaker.OPEN
+
+    assert client.post("/api/contact", json=body).status_code == 201
+    assert len(attempts) == 2
+    assert client.get("/api/health").json()["status"] == "degraded"
+
+
+@pytest.mark.anyio
+async def test_hung_smtp_opens_breaker_with_production_timeouts():
+    # Production SMTP cap and request budget, scaled down by the same factor
+    scale = 0.01
+    smtp = copy.deepcopy(email_service.email_breaker)
+    smtp.timeout = email_service.SMTP_TIMEOUT_SECONDS * scale
+    mongo_writes = server.MONGO_CALL_TIMEOUT_SECONDS * scale / 5
+
+    for _ in range(smtp.min_calls):
+        with request_deadline(server.REQUEST_TIMEOUT_SECONDS * scale):
+            await asyncio.sleep(mongo_writes)
+            with pytest.raises(DeadlineExceeded):
+                await smtp.call(hang)
+    assert smtp.state == CircuitBreaker.OPEN